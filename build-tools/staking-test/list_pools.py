@@ -13,20 +13,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 from datetime import datetime
-import os
-import sys
 
 from common import *
 
-SRC_ROOT_PATH = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-FUNC_TESTS_PATH = os.path.join(SRC_ROOT_PATH, "test", "functional")
-sys.path.append(FUNC_TESTS_PATH)
-
-from test_framework.authproxy import (
-    AuthServiceProxy,
-)
-
 
 node00_rpc = make_node_rpc(0)
 
@@ -36,10 +27,20 @@ bb_timestamp = node00_cs_info['best_block_timestamp']['timestamp']
 bb_time = datetime.fromtimestamp(bb_timestamp)
 print(f"Chainstate info at node 0: best block height = {bb_height}, best block time = {bb_time}")
 
-for i in range(NODES_COUNT):
-    wallet_rpc = make_wallet_rpc(i)
-    pools = wallet_rpc.staking_list_pools(0)
+wallet_rpcs = [make_wallet_rpc(i) for i in range(NODES_COUNT)]
+
+
+async def fetch_all_pools():
+    # AuthServiceProxy is blocking, so run each node's call in its own thread
+    # to have the requests to all the nodes in flight at the same time.
+    return await asyncio.gather(
+        *(asyncio.to_thread(wallet_rpc.staking_list_pools, 0) for wallet_rpc in wallet_rpcs)
+    )
+
+
+all_pools = asyncio.run(fetch_all_pools())
 
+for i, pools in enumerate(all_pools):
     print(f"Node {i} pools:")
     for pool in pools:
         print(f"id = {pool['pool_id']}; balances (staker, total) = {pool['pledge']['decimal']}, {pool['balance']['decimal']}")
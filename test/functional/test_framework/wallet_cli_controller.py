@@ -267,14 +267,14 @@ class WalletCliController:
         return await self._write_command(f"address-new\n")
 
     async def list_utxos(self, utxo_types: str = '', with_locked: str = '', utxo_states: List[str] = []) -> List[UtxoOutpoint]:
-        output = await self._write_command(f"account-utxos {utxo_types} {with_locked} {''.join(utxo_states)}\n")
+        output = await self._write_command(f"account-utxos {utxo_types} {with_locked} {' '.join(utxo_states)}\n")
 
         j = json.loads(output)
 
         return [UtxoOutpoint(id=match["outpoint"]["source_id"]["content"]["tx_id"], index=int(match["outpoint"]["index"])) for match in j]
 
     async def list_multisig_utxos(self, utxo_types: str = '', with_locked: str = '', utxo_states: List[str] = []) -> List[UtxoOutpoint]:
-        output = await self._write_command(f"standalone-multisig-utxos {utxo_types} {with_locked} {''.join(utxo_states)}\n")
+        output = await self._write_command(f"standalone-multisig-utxos {utxo_types} {with_locked} {' '.join(utxo_states)}\n")
 
         j = json.loads(output)
 
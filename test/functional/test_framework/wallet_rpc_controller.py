@@ -18,21 +18,73 @@
 
 import os
 import asyncio
+import threading
+import time
+import unittest
 import http.client
+import io
 import json
+import logging
+import dataclasses
 from dataclasses import dataclass
 from tempfile import NamedTemporaryFile
 import base64
+from collections import OrderedDict
 from operator import itemgetter
 
-from typing import Optional, List, Union
+from typing import Dict, Iterator, Optional, List, Tuple, Union
 
+try:
+    # orjson is an optional, much faster drop-in for encoding/decoding the RPC payloads
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+    json_loads = json.loads
+
+from test_framework.authproxy import JSONRPCException
 from test_framework.util import assert_in, rpc_port
 from test_framework.wallet_controller_common import PartialSigInfo, TokenTxOutput, UtxoOutpoint
 
 ONE_MB = 2**20
 READ_TIMEOUT_SEC = 30
 DEFAULT_ACCOUNT_INDEX = 0
+# extracts the result from a JSON-RPC response
+_RESULT = itemgetter('result')
+# Options passed to the tx-creating RPCs; these dicts are shared between all the calls,
+# so they must never be mutated.
+DEFAULT_TX_OPTIONS = {'in_top_x_mb': 5}
+EMPTY_TX_OPTIONS = {}
+# max number of calls sent in a single JSON-RPC batch request
+DEFAULT_BATCH_SIZE = 20
+# max number of encoded requests kept for reuse by a controller
+PAYLOAD_CACHE_SIZE = 64
+# read-only RPC methods that are polled repeatedly with the same params, whose encoded requests are reused
+PAYLOAD_CACHED_METHODS = {
+    "wallet_best_block",
+    "staking_status",
+    "address_show",
+    "staking_list_pools",
+    "staking_list_owned_pools_for_decommission",
+    "staking_list_created_block_ids",
+    "delegation_list_ids",
+    "transaction_list_pending",
+}
+# RPC methods that change the loaded wallet, after which nothing cached about the wallet is valid
+WALLET_CHANGING_METHODS = {
+    "wallet_create",
+    "wallet_open",
+    "wallet_close",
+}
+# RPC methods after which the cached pool and delegation lists may be stale
+STAKING_CACHE_INVALIDATING_METHODS = WALLET_CHANGING_METHODS | {
+    "wallet_sync",
+    "node_submit_transaction",
+    "staking_create_pool",
+    "staking_decommission_pool",
+    "delegation_create",
+    "delegation_stake",
+}
 
 @dataclass
 class TransferTxOutput:
@@ -47,19 +99,23 @@ class TransferTxOutput:
             return {'Transfer': [ { 'Coin': {"atoms": str(self.atoms)} }, f"HexifiedDestination{{0x02{self.pub_key_hex}}}" ]}
 
 
-@dataclass
+# Note: __slots__ is declared by hand rather than with dataclass(slots=True), which needs Python 3.10.
+@dataclass(frozen=True)
 class PoolData:
+    __slots__ = ('pool_id', 'pledge', 'balance')
     pool_id: str
     pledge: str
     balance: str
 
-@dataclass
+@dataclass(frozen=True)
 class DelegationData:
+    __slots__ = ('delegation_id', 'balance')
     delegation_id: str
     balance: str
 
 @dataclass
 class CreatedBlockInfo:
+    __slots__ = ('block_id', 'block_height', 'pool_id')
     block_id: str
     block_height: str
     pool_id: str
@@ -69,6 +125,18 @@ class AccountInfo:
     index: int
     name: Optional[str]
 
+def pools_from_json(pools: list) -> Iterator[PoolData]:
+    return (PoolData(pool['pool_id'], pool['pledge']['decimal'], pool['balance']['decimal']) for pool in pools)
+
+def delegations_from_json(delegations: list) -> Iterator[DelegationData]:
+    return (DelegationData(delegation['delegation_id'], delegation['balance']['decimal']) for delegation in delegations)
+
+def created_blocks_from_json(blocks: list) -> Iterator[CreatedBlockInfo]:
+    return (CreatedBlockInfo(block['id'], block['height'], block['pool_id']) for block in blocks)
+
+def utxos_from_json(utxos: list) -> Iterator[UtxoOutpoint]:
+    return (UtxoOutpoint(utxo["outpoint"]["source_id"]["content"]['tx_id'], int(utxo["outpoint"]['index'])) for utxo in utxos)
+
 class WalletRpcController:
     def __init__(self, node, config, log, wallet_args: List[str] = [], chain_config_args: List[str] = []):
         self.log = log
@@ -77,11 +145,18 @@ class WalletRpcController:
         self.wallet_args = wallet_args
         self.chain_config_args = chain_config_args
         self.account = DEFAULT_ACCOUNT_INDEX
+        # (account, address) -> result of address_reveal_public_key, valid for the currently loaded wallet
+        self._public_keys: Dict[Tuple[int, str], dict] = {}
+        # account -> result of the last list_pool_ids/list_delegation_ids, reused with use_cache
+        self._pool_cache: Dict[int, List[PoolData]] = {}
+        self._delegation_cache: Dict[int, List[DelegationData]] = {}
+        # (method, repr(params)) -> encoded request, least recently used first
+        self._payload_cache: OrderedDict[Tuple[str, str], bytes] = OrderedDict()
 
     async def __aenter__(self):
         cookie_file = os.path.join(self.node.datadir, ".cookie")
 
-        self.log.info(f"node url: {self.node.url}")
+        self.log.info("node url: %s", self.node.url)
         wallet_rpc = os.path.join(self.config["environment"]["BUILDDIR"], "test_rpc_wallet"+self.config["environment"]["EXEEXT"] )
         if "--rpc-username" in self.wallet_args:
             idx = self.wallet_args.index("--rpc-username")
@@ -89,7 +164,7 @@ class WalletRpcController:
             idx = self.wallet_args.index("--rpc-password")
             password = self.wallet_args[idx+1]
             credentials = f"{username}:{password}"
-            self.log.info(f'creds: {credentials}')
+            self.log.info("creds: %s", credentials)
             credentials_encoded = base64.b64encode(credentials.encode('utf-8')).decode('utf-8')
 
             def get_headers_user_pass():
@@ -98,7 +173,7 @@ class WalletRpcController:
                     'Content-Type': 'application/json'
                 }
 
-            self.headers = get_headers_user_pass
+            get_headers = get_headers_user_pass
         elif "--rpc-cookie-file" in self.wallet_args:
             idx = self.wallet_args.index("--rpc-cookie-file")
             wallet_cookie_file = os.path.join(self.node.datadir, self.wallet_args[idx+1])
@@ -110,11 +185,10 @@ class WalletRpcController:
                     'Authorization': f'Basic {credentials_encoded}',
                     'Content-Type': 'application/json'
                 }
-            self.headers = get_headers_cookie
+            get_headers = get_headers_cookie
         else:
             def get_headers():
                 return {'Content-Type': 'application/json'}
-            self.headers = get_headers
 
         if "--rpc-bind-address" in self.wallet_args:
             rpc_bind_addr_idx = self.wallet_args.index("--rpc-bind-address")
@@ -142,73 +216,201 @@ class WalletRpcController:
             stdout=asyncio.subprocess.PIPE,
             stderr=self.wallet_log_file,
         )
-        self.http_client = http.client.HTTPConnection(url, port)
-        await asyncio.sleep(5)
+        # nothing reads the wallet's stdout until it exits, so keep draining it to avoid
+        # the wallet blocking on a full pipe
+        self._drain_task = asyncio.create_task(self._drain(self.process.stdout, self.wallet_log_file))
+        # one keep-alive connection to this controller's own wallet process, which dies with it
+        self.http_client = http.client.HTTPConnection(url, port, timeout=READ_TIMEOUT_SEC)
+        self._http_lock = threading.Lock()
+        try:
+            await self._wait_ready(get_headers)
+        except BaseException:
+            # __aexit__ won't be called, so don't leave the wallet process and its files behind
+            if self.process.returncode is None:
+                self.process.kill()
+            await self.process.wait()
+            self._drain_task.cancel()
+            self.http_client.close()
+            self.wallet_log_file.close()
+            self.wallet_commands_file.close()
+            raise
         return self
 
+    async def _wait_ready(self, get_headers, timeout=READ_TIMEOUT_SEC, min_wait=0.1):
+        """Poll the wallet RPC server until it responds, with an exponential backoff."""
+        # if a wallet file is passed on the command line, also wait for it to be loaded
+        wait_for_wallet = "--wallet-file" in self.wallet_args
+        payload = json_dumps({"jsonrpc": "2.0", "method": "wallet_best_block", "params": [], "id": 1})
+
+        await asyncio.sleep(min_wait)
+        delay = 0.05
+        time_end = time.monotonic() + timeout
+        while time.monotonic() < time_end:
+            if self.process.returncode is not None:
+                raise AssertionError(f"Wallet RPC process exited with code {self.process.returncode}")
+            try:
+                # the credentials don't change for the lifetime of the wallet process,
+                # so the headers (and the cookie file) only need to be read once it has started
+                self.headers = {**get_headers(), 'Connection': 'keep-alive'}
+                response = json_loads(await self._send(payload))
+                if not wait_for_wallet or 'result' in response:
+                    return
+            except (OSError, ValueError, http.client.HTTPException):
+                # not started yet; the cookie file may be missing or incomplete, or the connection refused
+                pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+        raise AssertionError(f"Wallet RPC server not ready after {timeout} seconds")
+
     async def __aexit__(self, exc_type, exc_value, traceback):
         self.log.debug("exiting wallet")
-        self._write_command("shutdown")
+        await self._write_command("shutdown")
+        self._drain_task.cancel()
         await self.process.communicate()
         self.http_client.close()
         self.wallet_log_file.close()
         self.wallet_commands_file.close()
 
-    def _write_command(self, method: str, params = []) -> dict:
-        encoded_cmd = method.encode()
-        encoded_params = str(params).encode()
-        self.wallet_commands_file.write(b"writhing command: ")
-        self.wallet_commands_file.write(encoded_cmd)
-        self.wallet_commands_file.write(encoded_params)
-
-        payload = {
-            "jsonrpc": "2.0",
-            "method": method,
-            "params": params,
-            "id": 1  # Adjust the id field as needed
-        }
-        encoded_payload = json.dumps(payload).encode('utf-8')
-        self.http_client.request("POST", '', body=encoded_payload, headers=self.headers())
-        response = self.http_client.getresponse()
-        self.log.debug(f"method, {method}")
-        self.log.debug(f'response, {response} status: {response.status}')
-        body = response.read().decode('utf-8')
-        self.log.debug(f'body, {body}')
-        self.wallet_commands_file.write(response.read())
-        return json.loads(body)
+    @staticmethod
+    async def _drain(stream: asyncio.StreamReader, output_file):
+        while True:
+            output = await stream.read(ONE_MB)
+            if not output:
+                break
+            output_file.write(output)
+
+    async def _write_command(self, method: str, params = []) -> dict:
+        # polling calls like wallet_best_block send the same payload over and over,
+        # so reuse the encoded request instead of serializing it each time
+        key = (method, repr(params)) if method in PAYLOAD_CACHED_METHODS else None
+        encoded_payload = self._payload_cache.get(key) if key is not None else None
+        if encoded_payload is None:
+            payload = {
+                "jsonrpc": "2.0",
+                "method": method,
+                "params": params,
+                "id": 1  # Adjust the id field as needed
+            }
+            encoded_payload = json_dumps(payload)
+            if key is not None:
+                self._payload_cache[key] = encoded_payload
+                if len(self._payload_cache) > PAYLOAD_CACHE_SIZE:
+                    self._payload_cache.popitem(last=False)
+        else:
+            self._payload_cache.move_to_end(key)
+        self.log.debug("method=%s", method)
+        self._invalidate_caches(method)
+        body = await self._send(encoded_payload)
+        self.wallet_commands_file.write(b"writing command: " + encoded_payload + b"\nresp: " + body + b"\n")
+        return json_loads(body)
+
+    async def batch(self, calls: List[Tuple[str, list]], batch_size: int = DEFAULT_BATCH_SIZE) -> List[dict]:
+        """Send several RPC calls as JSON-RPC batches of at most batch_size calls each.
+
+        The responses are returned in the same order as the calls; the results of the listing
+        calls can be converted with pools_from_json, delegations_from_json etc.
+        """
+        results = []
+        for start in range(0, len(calls), batch_size):
+            chunk = calls[start:start + batch_size]
+            payload = [
+                {
+                    "jsonrpc": "2.0",
+                    "method": method,
+                    "params": params,
+                    "id": start + idx,
+                }
+                for idx, (method, params) in enumerate(chunk)
+            ]
+            encoded_payload = json_dumps(payload)
+            self.log.debug("batch of %d calls", len(chunk))
+            for method, _ in chunk:
+                self._invalidate_caches(method)
+            body = await self._send(encoded_payload)
+            self.wallet_commands_file.write(b"writing batch: " + encoded_payload + b"\nresp: " + body + b"\n")
+            responses = json_loads(body)
+            if not isinstance(responses, list):
+                # the server rejected the batch as a whole and answered with a single error object
+                raise JSONRPCException(responses.get('error', responses))
+            for response in responses:
+                if not isinstance(response.get('id'), int):
+                    # a call the server couldn't parse is answered with a null id and an error
+                    raise JSONRPCException(response.get('error', response))
+            responses.sort(key=itemgetter('id'))
+            if [response['id'] for response in responses] != [call['id'] for call in payload]:
+                raise JSONRPCException({
+                    'code': -342, 'message': f'batch response ids {[response["id"] for response in responses]} don\'t match the request'})
+            results += responses
+        return results
+
+    def _invalidate_caches(self, method: str):
+        if method in WALLET_CHANGING_METHODS:
+            self._public_keys.clear()
+        if method in STAKING_CACHE_INVALIDATING_METHODS:
+            self._pool_cache.clear()
+            self._delegation_cache.clear()
+
+    async def _send(self, encoded_payload: bytes) -> bytes:
+        # http.client is blocking, so run the exchange in a worker thread to keep the event loop free
+        return await asyncio.to_thread(self._post, encoded_payload)
+
+    def _post(self, encoded_payload: bytes) -> bytes:
+        # requests may be sent from several worker threads, only one at a time can use the connection
+        with self._http_lock:
+            try:
+                # Only retry if the request couldn't be sent, so the server can't have processed it;
+                # once it has been sent, a call like address_send must never be sent twice, so any
+                # error from there on is raised.
+                try:
+                    self.http_client.request("POST", '', body=encoded_payload, headers=self.headers)
+                except (BrokenPipeError, ConnectionResetError):
+                    # the persistent connection was dropped by the server while idle
+                    self.http_client.close()
+                    self.http_client.request("POST", '', body=encoded_payload, headers=self.headers)
+                response = self.http_client.getresponse()
+                body = response.read()
+            except (OSError, http.client.HTTPException):
+                # don't leave a half-finished exchange on the connection
+                self.http_client.close()
+                raise
+        self.log.debug("status=%s", response.status)
+        # the body can be large (e.g. utxo lists), only format it if it's going to be printed
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("body=%s", body.decode('utf-8', 'replace'))
+        return body
 
     async def create_wallet(self, name: str = "wallet", mnemonic: Optional[str] = None) -> str:
         wallet_file = os.path.join(self.node.datadir, name)
-        self._write_command("wallet_create", [wallet_file, True, mnemonic])
+        await self._write_command("wallet_create", [wallet_file, True, mnemonic])
         return "New wallet created successfully"
 
     async def open_wallet(self, name: str = "wallet", password: Optional[str] = None, force_change_wallet_type: bool = False) -> str:
         wallet_file = os.path.join(self.node.datadir, name)
-        output = self._write_command("wallet_open", [wallet_file, password, force_change_wallet_type])
+        output = await self._write_command("wallet_open", [wallet_file, password, force_change_wallet_type])
         if 'result' in output:
             return "Wallet loaded successfully"
         else:
             return output['error']['message']
 
     async def close_wallet(self) -> str:
-        return self._write_command("wallet_close", [])['result']
+        return _RESULT(await self._write_command("wallet_close", []))
 
     async def wallet_info(self) -> List[AccountInfo]:
-        result = self._write_command("wallet_info", [])['result']
+        result = _RESULT(await self._write_command("wallet_info", []))
         return [AccountInfo(idx, name) for idx, name in enumerate(result['account_names'])]
 
     async def get_best_block_height(self) -> str:
-        return str(self._write_command("wallet_best_block", [])['result']['height'])
+        return str(_RESULT(await self._write_command("wallet_best_block", []))['height'])
 
     async def get_best_block(self) -> str:
-        return self._write_command("wallet_best_block", [])['result']['id']
+        return _RESULT(await self._write_command("wallet_best_block", []))['id']
 
     async def create_new_account(self, name: Optional[str] = None) -> str:
-        result = self._write_command("account_create", [name])['result']
+        result = _RESULT(await self._write_command("account_create", [name]))
         return f"Success, the new account index is: {result['account']}"
 
     async def rename_account(self, name: Optional[str] = None) -> str:
-        self._write_command("account_rename", [self.account, name])
+        await self._write_command("account_rename", [self.account, name])
         return "Success, the account name has been successfully renamed"
 
     async def select_account(self, account_index: int) -> str:
@@ -219,46 +421,56 @@ class WalletRpcController:
     async def add_standalone_multisig_address_get_result(
             self, min_required_signatures: int, pub_keys: List[str], label: Optional[str] = None, no_rescan: Optional[bool] = None) -> str:
 
-        result = self._write_command("standalone_add_multisig", [self.account, min_required_signatures, pub_keys, label, no_rescan])
-        return result['result']
+        return _RESULT(await self._write_command("standalone_add_multisig", [self.account, min_required_signatures, pub_keys, label, no_rescan]))
 
     async def new_public_key(self, address: Optional[str] = None) -> bytes:
         if address is None:
             address = await self.new_address()
-        public_key = self._write_command("address_reveal_public_key", [self.account, address])['result']['public_key_hex']
+        public_key = (await self._reveal_public_key(address))['public_key_hex']
 
         # remove the pub key enum value, the first one byte
         pub_key_bytes = bytes.fromhex(public_key)[1:]
         return pub_key_bytes
 
     async def reveal_public_key_as_address(self, address: Optional[str] = None) -> str:
-        return self._write_command("address_reveal_public_key", [self.account, address])['result']['public_key_address']
+        return (await self._reveal_public_key(address))['public_key_address']
 
     async def reveal_public_key_as_hex(self, address: Optional[str] = None) -> str:
-        return self._write_command("address_reveal_public_key", [self.account, address])['result']['public_key_hex']
+        return (await self._reveal_public_key(address))['public_key_hex']
+
+    async def _reveal_public_key(self, address: Optional[str]) -> dict:
+        # the public key behind an address never changes, so only ask the wallet once per address
+        key = (self.account, address)
+        if key not in self._public_keys:
+            self._public_keys[key] = _RESULT(await self._write_command("address_reveal_public_key", [self.account, address]))
+        return self._public_keys[key]
 
     async def new_address(self) -> str:
-        return self._write_command(f"address_new", [self.account])['result']['address']
+        return _RESULT(await self._write_command("address_new", [self.account]))['address']
 
     async def add_standalone_multisig_address(self, min_required_signatures: int, pub_keys: List[str], label: Optional[str] = None) -> str:
-        return self._write_command("standalone_add_multisig", [self.account, min_required_signatures, pub_keys, label, None])['result']
+        return _RESULT(await self._write_command("standalone_add_multisig", [self.account, min_required_signatures, pub_keys, label, None]))
 
     async def list_utxos(self, utxo_types: str = '', with_locked: str = '', utxo_states: List[str] = []) -> List[UtxoOutpoint]:
-        outputs = self._write_command("account_utxos", [self.account, utxo_types, with_locked, ''.join(utxo_states)])['result']
-        return [UtxoOutpoint(tx_id=match["outpoint"]["source_id"]["content"]['tx_id'], index=int(match["outpoint"]['index'])) for match in outputs]
+        return list(await self.iter_utxos(utxo_types, with_locked, utxo_states))
+
+    # Same as list_utxos, but the outpoints are created lazily while iterating over the result.
+    async def iter_utxos(self, utxo_types: str = '', with_locked: str = '', utxo_states: List[str] = []) -> Iterator[UtxoOutpoint]:
+        outputs = _RESULT(await self._write_command("account_utxos", [self.account, utxo_types, with_locked, utxo_states]))
+        return utxos_from_json(outputs)
 
     async def get_transaction(self, tx_id: str) -> str:
-        return self._write_command("transaction_get", [self.account, tx_id])['result']
+        return _RESULT(await self._write_command("transaction_get", [self.account, tx_id]))
 
     async def get_raw_signed_transaction(self, tx_id: str) -> str:
-        return self._write_command("transaction_get_signed_raw", [self.account, tx_id])['result']
+        return _RESULT(await self._write_command("transaction_get_signed_raw", [self.account, tx_id]))
 
     async def send_to_address(self, address: str, amount: int, selected_utxos: List[UtxoOutpoint] = []) -> str:
-        self._write_command("address_send", [self.account, address, {'decimal': str(amount)}, selected_utxos, {'in_top_x_mb': 5}])
+        await self._write_command("address_send", [self.account, address, {'decimal': str(amount)}, selected_utxos, DEFAULT_TX_OPTIONS])
         return "The transaction was submitted successfully"
 
     async def send_tokens_to_address(self, token_id: str, address: str, amount: Union[float, str]):
-        return self._write_command("token_send", [self.account, token_id, address, {'decimal': str(amount)}, {'in_top_x_mb': 5}])['result']
+        return _RESULT(await self._write_command("token_send", [self.account, token_id, address, {'decimal': str(amount)}, DEFAULT_TX_OPTIONS]))
 
     # Note: unlike send_tokens_to_address, this function behaves identically both for wallet_cli_controller and wallet_rpc_controller.
     async def send_tokens_to_address_or_fail(self, token_id: str, address: str, amount: Union[float, str]):
@@ -277,7 +489,7 @@ class WalletRpcController:
         else:
             token_supply = { "type": "Fixed", "content": {'decimal': str(token_supply)} }
 
-        result = self._write_command('token_issue_new', [
+        result = await self._write_command('token_issue_new', [
             self.account,
             destination_address,
             {
@@ -287,7 +499,7 @@ class WalletRpcController:
                 'token_supply': token_supply,
                 'is_freezable': is_freezable,
             },
-            {'in_top_x_mb': 5}
+            DEFAULT_TX_OPTIONS
         ])
 
         if 'result' in result:
@@ -296,7 +508,7 @@ class WalletRpcController:
             return None, result['error']
 
     async def mint_tokens(self, token_id: str, address: str, amount: int) -> str:
-        return self._write_command("token_mint", [self.account, token_id, address, {'decimal': str(amount)}, {'in_top_x_mb': 5}])['result']
+        return _RESULT(await self._write_command("token_mint", [self.account, token_id, address, {'decimal': str(amount)}, DEFAULT_TX_OPTIONS]))
 
     # Note: unlike mint_tokens, this function behaves identically both for wallet_cli_controller and wallet_rpc_controller.
     async def mint_tokens_or_fail(self, token_id: str, address: str, amount: int):
@@ -304,22 +516,22 @@ class WalletRpcController:
         await self.mint_tokens(token_id, address, amount)
 
     async def unmint_tokens(self, token_id: str, amount: int) -> str:
-        return self._write_command("token_unmint", [self.account, token_id, {'decimal': str(amount)}, {'in_top_x_mb': 5}])['result']
+        return _RESULT(await self._write_command("token_unmint", [self.account, token_id, {'decimal': str(amount)}, DEFAULT_TX_OPTIONS]))
 
     async def lock_token_supply(self, token_id: str) -> str:
-        return self._write_command("token_lock_supply", [self.account, token_id, {'in_top_x_mb': 5}])['result']
+        return _RESULT(await self._write_command("token_lock_supply", [self.account, token_id, DEFAULT_TX_OPTIONS]))
 
     async def freeze_token(self, token_id: str, is_unfreezable: str) -> str:
-        return self._write_command("token_freeze", [self.account, token_id, is_unfreezable, {'in_top_x_mb': 5}])['result']
+        return _RESULT(await self._write_command("token_freeze", [self.account, token_id, is_unfreezable, DEFAULT_TX_OPTIONS]))
 
     async def unfreeze_token(self, token_id: str) -> str:
-        return self._write_command("token_unfreeze", [self.account, token_id, {'in_top_x_mb': 5}])['result']
+        return _RESULT(await self._write_command("token_unfreeze", [self.account, token_id, DEFAULT_TX_OPTIONS]))
 
     async def change_token_authority(self, token_id: str, new_authority: str) -> str:
-        return self._write_command("token_change_authority", [self.account, token_id, new_authority, {'in_top_x_mb': 5}])['result']
+        return _RESULT(await self._write_command("token_change_authority", [self.account, token_id, new_authority, DEFAULT_TX_OPTIONS]))
 
     async def change_token_metadata_uri(self, token_id: str, new_metadata_uri: str) -> str:
-        return self._write_command("token_change_metadata_uri", [self.account, token_id, new_metadata_uri, {'in_top_x_mb': 5}])['result']
+        return _RESULT(await self._write_command("token_change_metadata_uri", [self.account, token_id, new_metadata_uri, DEFAULT_TX_OPTIONS]))
 
     async def issue_new_nft(self,
                             destination_address: str,
@@ -331,7 +543,7 @@ class WalletRpcController:
                             icon_uri: Optional[str] = '',
                             media_uri: Optional[str] = '',
                             additional_metadata_uri: Optional[str] = ''):
-        output = self._write_command("token_nft_issue_new", [
+        output = _RESULT(await self._write_command("token_nft_issue_new", [
             self.account,
             destination_address,
             {
@@ -344,8 +556,8 @@ class WalletRpcController:
                 'media_uri': media_uri,
                 'additional_metadata_uri': additional_metadata_uri
             },
-            {'in_top_x_mb': 5}
-            ])['result']
+            DEFAULT_TX_OPTIONS
+            ]))
         return output
 
     async def create_stake_pool(self,
@@ -354,72 +566,82 @@ class WalletRpcController:
                                 margin_ratio_per_thousand: float,
                                 decommission_key: Optional[str] = None) -> str:
         #decommission_key = decommission_key if decommission_key else 'NULL'
-        self._write_command("staking_create_pool", [self.account, {'decimal': str(amount)}, {'decimal': str(cost_per_block)}, str(margin_ratio_per_thousand), decommission_key, {'in_top_x_mb': 5}])['result']
+        _RESULT(await self._write_command("staking_create_pool", [self.account, {'decimal': str(amount)}, {'decimal': str(cost_per_block)}, str(margin_ratio_per_thousand), decommission_key, DEFAULT_TX_OPTIONS]))
         return "The transaction was submitted successfully"
 
     async def decommission_stake_pool(self, pool_id: str, address: str) -> str:
-        self._write_command("staking_decommission_pool", [self.account, pool_id, address, {'in_top_x_mb': 5}])['result']
+        _RESULT(await self._write_command("staking_decommission_pool", [self.account, pool_id, address, DEFAULT_TX_OPTIONS]))
         return "The transaction was submitted successfully"
 
     async def submit_transaction(self, transaction: str, do_not_store: bool = False) -> str:
-        result = self._write_command(f"node_submit_transaction", [transaction, do_not_store, {}])
+        result = await self._write_command("node_submit_transaction", [transaction, do_not_store, EMPTY_TX_OPTIONS])
         if 'result' in result:
             return f"The transaction was submitted successfully\n\n{result['result']['tx_id']}"
         else:
             return result['error']['message']
 
-    async def list_pool_ids(self) -> List[PoolData]:
-        pools = self._write_command("staking_list_pools", [self.account])['result']
-        return [PoolData(pool['pool_id'], pool['pledge']['decimal'], pool['balance']['decimal']) for pool in pools]
+    # Note: with use_cache, the result of the last call is reused until a call that may change it
+    # is made through this controller, e.g. wallet_sync. Only use it if nothing else changes the
+    # wallet in the meantime; background sync and staking don't invalidate the cache.
+    async def list_pool_ids(self, use_cache: bool = False) -> List[PoolData]:
+        if not use_cache or self.account not in self._pool_cache:
+            self._pool_cache[self.account] = list(await self.iter_pool_ids())
+        return list(self._pool_cache[self.account])
+
+    # Same as list_pool_ids, but the pools are created lazily while iterating over the result.
+    async def iter_pool_ids(self, use_cache: bool = False) -> Iterator[PoolData]:
+        if use_cache and self.account in self._pool_cache:
+            return iter(self._pool_cache[self.account])
+        return pools_from_json(_RESULT(await self._write_command("staking_list_pools", [self.account])))
 
     async def list_pools_for_decommission(self) -> List[PoolData]:
-        pools = self._write_command("staking_list_owned_pools_for_decommission", [self.account])['result']
+        pools = _RESULT(await self._write_command("staking_list_owned_pools_for_decommission", [self.account]))
         return [PoolData(pool['pool_id'], pool['pledge'], pool['balance']) for pool in pools]
 
     async def list_created_blocks_ids(self) -> List[CreatedBlockInfo]:
-        output = self._write_command("staking_list_created_block_ids", [self.account])['result']
-        return [CreatedBlockInfo(block['id'], block['height'], block['pool_id']) for block in output]
+        return list(created_blocks_from_json(_RESULT(await self._write_command("staking_list_created_block_ids", [self.account]))))
 
     async def create_delegation(self, address: str, pool_id: str) -> Optional[str]:
-        return self._write_command("delegation_create", [self.account, address, pool_id, {'in_top_x_mb': 5}])['result']['delegation_id']
+        return _RESULT(await self._write_command("delegation_create", [self.account, address, pool_id, DEFAULT_TX_OPTIONS]))['delegation_id']
 
     async def stake_delegation(self, amount: int, delegation_id: str) -> str:
-        self._write_command(f"delegation_stake", [self.account, {'decimal': str(amount)}, delegation_id, {'in_top_x_mb': 5}])['result']
+        _RESULT(await self._write_command("delegation_stake", [self.account, {'decimal': str(amount)}, delegation_id, DEFAULT_TX_OPTIONS]))
         return "Success"
 
-    async def list_delegation_ids(self) -> List[DelegationData]:
-        delegations = self._write_command("delegation_list_ids", [self.account])['result']
-        return [DelegationData(delegation['delegation_id'], delegation['balance']['decimal']) for delegation in delegations]
+    # Note: cached the same way as list_pool_ids.
+    async def list_delegation_ids(self, use_cache: bool = False) -> List[DelegationData]:
+        if not use_cache or self.account not in self._delegation_cache:
+            self._delegation_cache[self.account] = list(delegations_from_json(_RESULT(await self._write_command("delegation_list_ids", [self.account]))))
+        return list(self._delegation_cache[self.account])
 
     async def deposit_data(self, data: str) -> str:
-        return self._write_command("address_deposit_data", [self.account, data, {'in_top_x_mb': 5}])['result']
+        return _RESULT(await self._write_command("address_deposit_data", [self.account, data, DEFAULT_TX_OPTIONS]))
 
     async def sync(self) -> str:
-        self._write_command("wallet_sync")
+        await self._write_command("wallet_sync")
         return "Success"
 
     async def start_staking(self) -> str:
-        self._write_command(f"staking_start", [self.account])['result']
+        _RESULT(await self._write_command("staking_start", [self.account]))
         return "Staking started successfully"
 
     async def stop_staking(self) -> str:
-        self._write_command(f"staking_stop", [self.account])['result']
+        _RESULT(await self._write_command("staking_stop", [self.account]))
         return "Success"
 
     async def staking_status(self) -> str:
-        result = self._write_command(f"staking_status", [self.account])['result']
+        result = _RESULT(await self._write_command("staking_status", [self.account]))
         if result == "Staking":
             return "Staking"
         else:
             return "Not staking"
 
     async def get_addresses_usage(self) -> str:
-        return self._write_command("address_show", [self.account])['result']
+        return _RESULT(await self._write_command("address_show", [self.account]))
 
     async def get_balance(self, with_locked: str = 'unlocked', utxo_states: List[str] = ['confirmed']) -> str:
         with_locked = with_locked.capitalize()
-        result = self._write_command("account_balance", [self.account, [state.title() for state in utxo_states], with_locked])
-        result = result['result']
+        result = _RESULT(await self._write_command("account_balance", [self.account, [state.title() for state in utxo_states], with_locked]))
 
         coins = result['coins']['decimal']
         tokens = {}
@@ -433,14 +655,14 @@ class WalletRpcController:
         return "\n".join([f"Coins amount: {coins}"] + [f"Token: {token} amount: {amount}" for token, amount in tokens.items()])
 
     async def list_pending_transactions(self) -> List[str]:
-        output = self._write_command("transaction_list_pending", [self.account])['result']
+        output = _RESULT(await self._write_command("transaction_list_pending", [self.account]))
         return output
 
     async def abandon_transaction(self, tx_id: str) -> str:
-        return self._write_command("transaction_abandon", [self.account, tx_id])['result']
+        return _RESULT(await self._write_command("transaction_abandon", [self.account, tx_id]))
 
     async def sign_raw_transaction(self, transaction: str) -> str:
-        result = self._write_command("account_sign_raw_transaction", [self.account, transaction, {'in_top_x_mb': 5}])
+        result = await self._write_command("account_sign_raw_transaction", [self.account, transaction, DEFAULT_TX_OPTIONS])
         if 'result' in result:
             if result['result']['is_complete']:
                 return f"The transaction has been fully signed and is ready to be broadcast to network\n\n{result['result']['hex']}"
@@ -458,36 +680,36 @@ class WalletRpcController:
         return lines[1]
 
     async def sign_challenge_plain(self, message: str, address: str) -> str:
-        result = self._write_command('challenge_sign_plain', [self.account, message, address])
+        result = await self._write_command('challenge_sign_plain', [self.account, message, address])
         if 'result' in result:
             return f"The generated hex encoded signature is\n\n{result['result']}"
         else:
             return result['error']['message']
 
     async def sign_challenge_hex(self, message: str, address: str) -> str:
-        result =  self._write_command('challenge_sign_hex', [self.account, message, address])
+        result =  await self._write_command('challenge_sign_hex', [self.account, message, address])
         if 'result' in result:
             return f"The generated hex encoded signature is\n\n{result['result']}"
         else:
             return result['error']['message']
 
     async def verify_challenge_plain(self, message: str, signature: str, address: str) -> str:
-        result = self._write_command('challenge_verify_plain', [message, signature, address])
+        result = await self._write_command('challenge_verify_plain', [message, signature, address])
         if 'result' in result:
-            return f"The provided signature is correct"
+            return "The provided signature is correct"
         else:
             return result['error']['message']
 
     async def verify_challenge_hex(self, message: str, signature: str, address: str) -> str:
-        result = self._write_command('challenge_verify_hex', [message, signature, address])
+        result = await self._write_command('challenge_verify_hex', [message, signature, address])
         if 'result' in result:
-            return f"The provided signature is correct"
+            return "The provided signature is correct"
         else:
             return result['error']['message']
 
     async def create_from_cold_address(self, address: str, amount: int, selected_utxo: UtxoOutpoint, change_address: Optional[str] = None) -> str:
         utxo = selected_utxo.to_json()
-        result = self._write_command("transaction_create_from_cold_input", [self.account, address, {'decimal': str(amount)}, utxo, change_address, {'in_top_x_mb': 5}])
+        result = await self._write_command("transaction_create_from_cold_input", [self.account, address, {'decimal': str(amount)}, utxo, change_address, DEFAULT_TX_OPTIONS])
         if 'result' in result:
             return f"Send transaction created\n\n{result['result']['hex']}"
         else:
@@ -503,11 +725,9 @@ class WalletRpcController:
             for output in outputs
         ]
 
-        result = self._write_command(
+        return _RESULT(await self._write_command(
             "make_tx_to_send_tokens_from_multisig_address",
-            [self.account, from_address, fee_change_addr, outputs, {'in_top_x_mb': 5}])
-
-        return result['result']
+            [self.account, from_address, fee_change_addr, outputs, DEFAULT_TX_OPTIONS]))
 
     async def make_tx_to_send_tokens_from_multisig_address_expect_fully_signed(
             self, from_address: str, outputs: List[TokenTxOutput], fee_change_addr: Optional[str]):
@@ -545,7 +765,7 @@ class WalletRpcController:
         utxos = [utxo.to_json() for utxo in selected_utxos]
         outputs = [output.to_json() for output in outputs]
         print(outputs)
-        result = self._write_command('transaction_compose', [utxos, outputs, htlc_secrets, only_transaction])
+        result = await self._write_command('transaction_compose', [utxos, outputs, htlc_secrets, only_transaction])
         return result
 
     async def create_htlc_transaction(self,
@@ -557,6 +777,143 @@ class WalletRpcController:
                          refund_lock_for_blocks: int) -> str:
         timelock = { "type": "ForBlockCount", "content": refund_lock_for_blocks }
         htlc = { "secret_hash": secret_hash, "spend_address": spend_address, "refund_address": refund_address, "refund_timelock": timelock }
-        object = [self.account, {'decimal': str(amount)}, token_id, htlc, {'in_top_x_mb': 5}]
-        result = self._write_command("create_htlc_transaction", object)
-        return result['result']
+        object = [self.account, {'decimal': str(amount)}, token_id, htlc, DEFAULT_TX_OPTIONS]
+        return _RESULT(await self._write_command("create_htlc_transaction", object))
+
+
+class TestFrameworkWalletRpcController(unittest.TestCase):
+    def make_controller(self, respond):
+        controller = WalletRpcController(None, None, logging.getLogger("TestFramework.wallet_rpc"))
+        controller.wallet_commands_file = io.BytesIO()
+        controller.requests = []
+
+        async def send(encoded_payload):
+            request = json_loads(encoded_payload)
+            controller.requests.append(request)
+            return json_dumps(respond(request))
+        controller._send = send
+        return controller
+
+    def test_batch(self):
+        # answer in reverse order, the results must still follow the order of the calls
+        def respond(request):
+            return [{"jsonrpc": "2.0", "id": call["id"], "result": call["method"]} for call in reversed(request)]
+        controller = self.make_controller(respond)
+
+        calls = [(f"method_{i}", [i]) for i in range(5)]
+        results = asyncio.run(controller.batch(calls, batch_size=2))
+        self.assertEqual([result["result"] for result in results], [method for method, _ in calls])
+        self.assertEqual([len(request) for request in controller.requests], [2, 2, 1])
+
+    def test_batch_errors(self):
+        # the whole batch is rejected
+        error = {"code": -32600, "message": "Invalid request"}
+        controller = self.make_controller(lambda request: {"jsonrpc": "2.0", "id": None, "error": error})
+        with self.assertRaises(JSONRPCException) as context:
+            asyncio.run(controller.batch([("wallet_best_block", [])]))
+        self.assertEqual(context.exception.error, error)
+
+        # a response is missing
+        controller = self.make_controller(lambda request: [{"jsonrpc": "2.0", "id": 0, "result": None}])
+        with self.assertRaises(JSONRPCException):
+            asyncio.run(controller.batch([("wallet_best_block", []), ("wallet_best_block", [])]))
+
+        # a single call is rejected and answered with a null id
+        controller = self.make_controller(lambda request: [
+            {"jsonrpc": "2.0", "id": 0, "result": None}, {"jsonrpc": "2.0", "id": None, "error": error}])
+        with self.assertRaises(JSONRPCException) as context:
+            asyncio.run(controller.batch([("wallet_best_block", []), ("wallet_best_block", [])]))
+        self.assertEqual(context.exception.error, error)
+
+    def test_cache_invalidation(self):
+        def respond(request):
+            if request["method"] == "staking_list_pools":
+                result = [{"pool_id": "pool", "pledge": {"decimal": "40000"}, "balance": {"decimal": "40000"}}]
+            elif request["method"] == "delegation_list_ids":
+                result = [{"delegation_id": "delegation", "balance": {"decimal": "1000"}}]
+            elif request["method"] == "address_reveal_public_key":
+                result = {"public_key_hex": "00aa", "public_key_address": "address"}
+            else:
+                result = {"delegation_id": "delegation"}
+            return {"jsonrpc": "2.0", "id": 1, "result": result}
+        controller = self.make_controller(respond)
+
+        async def num_listing_calls(action):
+            await controller.list_pool_ids(use_cache=True)
+            await controller.list_delegation_ids(use_cache=True)
+            await controller.reveal_public_key_as_hex("address")
+            num_requests = len(controller.requests)
+            await action()
+            await controller.list_pool_ids(use_cache=True)
+            await controller.list_delegation_ids(use_cache=True)
+            await controller.reveal_public_key_as_hex("address")
+            return len(controller.requests) - num_requests
+
+        async def no_op():
+            pass
+        # served from the caches
+        self.assertEqual(asyncio.run(num_listing_calls(no_op)), 0)
+        # the staking caches are dropped by calls that may change them, the public keys are kept
+        self.assertEqual(asyncio.run(num_listing_calls(controller.sync)), 1 + 2)
+        self.assertEqual(asyncio.run(num_listing_calls(lambda: controller.create_stake_pool(40000, 0, 0.5))), 1 + 2)
+        self.assertEqual(asyncio.run(num_listing_calls(lambda: controller.create_delegation("address", "pool"))), 1 + 2)
+        # everything is dropped when the wallet changes
+        self.assertEqual(asyncio.run(num_listing_calls(controller.close_wallet)), 1 + 3)
+
+        # without use_cache the staking lists are always queried
+        num_requests = len(controller.requests)
+        asyncio.run(controller.list_pool_ids())
+        asyncio.run(controller.list_delegation_ids())
+        self.assertEqual(len(controller.requests) - num_requests, 2)
+
+        # the cached objects can't be changed through the returned lists
+        pools = asyncio.run(controller.list_pool_ids())
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            pools[0].balance = "0"
+
+    def test_payload_cache(self):
+        controller = self.make_controller(lambda request: {"jsonrpc": "2.0", "id": 1, "result": {"height": 0, "id": "00"}})
+        asyncio.run(controller.get_best_block_height())
+        asyncio.run(controller.get_best_block())
+        asyncio.run(controller.deposit_data("00"))
+        # only the polled read-only call is kept
+        self.assertEqual(list(controller._payload_cache), [("wallet_best_block", "[]")])
+
+    def test_post_retry(self):
+        class Response:
+            status = 200
+            def read(self):
+                return b'{"jsonrpc": "2.0", "id": 1, "result": null}'
+
+        class Connection:
+            def __init__(self, request_errors, response_errors):
+                self.request_errors = request_errors
+                self.response_errors = response_errors
+                self.num_requests = 0
+            def request(self, *args, **kwargs):
+                self.num_requests += 1
+                if self.request_errors:
+                    raise self.request_errors.pop(0)
+            def getresponse(self):
+                if self.response_errors:
+                    raise self.response_errors.pop(0)
+                return Response()
+            def close(self):
+                pass
+
+        controller = WalletRpcController(None, None, logging.getLogger("TestFramework.wallet_rpc"))
+        controller.headers = {}
+        controller._http_lock = threading.Lock()
+
+        # the request couldn't be sent: retried
+        for request_error in [BrokenPipeError(), ConnectionResetError()]:
+            controller.http_client = Connection([request_error], [])
+            controller._post(b'')
+            self.assertEqual(controller.http_client.num_requests, 2)
+
+        # the server may have processed the request already: not retried
+        for response_error in [ConnectionResetError(), http.client.RemoteDisconnected()]:
+            controller.http_client = Connection([], [response_error])
+            with self.assertRaises(type(response_error)):
+                controller._post(b'')
+            self.assertEqual(controller.http_client.num_requests, 1)
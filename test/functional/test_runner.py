@@ -96,6 +96,7 @@ TEST_FRAMEWORK_MODULES = [
     "script",
     "segwit_addr",
     "util",
+    "wallet_rpc_controller",
 ]
 
 EXTENDED_SCRIPTS = [
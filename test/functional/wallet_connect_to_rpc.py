@@ -32,6 +32,7 @@ from test_framework.util import assert_in, assert_equal
 from test_framework.mintlayer import mintlayer_hash, block_input_data_obj
 from test_framework.wallet_cli_controller import WalletCliController
 from test_framework.wallet_rpc_controller import WalletRpcController
+from test_framework.wallet_controller_common import UtxoOutpoint
 from test_framework.util import rpc_port
 
 import asyncio
@@ -177,6 +178,12 @@ class WalletSubmitTransaction(BitcoinTestFramework):
                 assert_in(f"Coins amount: {coins_to_send}", await wallet2.get_balance())
                 assert_in(f"Coins amount: {coins_to_send}", await wallet1.get_balance())
 
+                # the received coins are the only utxo of the wallet
+                utxos = await wallet1.list_utxos()
+                assert_equal(utxos, [UtxoOutpoint(tx_id, 0)])
+                if isinstance(wallet1, WalletRpcController):
+                    assert_equal(list(await wallet1.iter_utxos()), utxos)
+
 
                 # ==== Try to close/open the wallet from wallet1 and check that wallet2 will report the change
                 # close and create a new wallet